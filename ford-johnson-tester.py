@@ -5,8 +5,9 @@ import random
 import re
 import subprocess
 import sys
-from concurrent.futures import ProcessPoolExecutor, as_completed
-from math import ceil, log2
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import repeat
 
 
 class ErrorCode:
@@ -34,26 +35,45 @@ class C:
 
 ALIGN = 50
 
+# Patterns used on every run of the executable are compiled once at import time.
+# The output of the executable is matched as raw bytes and only decoded when it has to be shown.
+_COMPARISONS_RE = re.compile(rb"^Number of comparisons: ([0-9]+)$", re.MULTILINE)
+_AFTER_RE = re.compile(rb"^\s*After:\s*\[?((?:\d+\s*)+)\]?\s*$", re.MULTILINE)
+_ANSI_RE = re.compile(rb"\x1b\[[0-9;]*m")
+_ANSI_TEXT_RE = re.compile(r"\x1b\[[0-9;]*m")
+_RANGE_RE = re.compile(r"^\d+-\d+(?:,\s*\d+-\d+)*$")
+_SPLIT_RE = re.compile(r"\s*,\s*")
+
+
+def align(text: str):
+    """
+    Pads the text to ALIGN visible characters, not counting the terminal color codes.
+    """
+    return text + " " * (ALIGN - len(_ANSI_TEXT_RE.sub("", text)))
 
-def format_result(label: str, result: int | float, okcolor: str):
-    type_of_result = type(result)
-    result_str = ""
-    if type_of_result is int:
-        result_str = f"{result}"
-    elif type_of_result is float:
-        result_str = f"{result:.1f}"
-    return (
-        f"{label}{C.FAIL}{result_str}{C.ENDC}".ljust(ALIGN) + f"{C.FAIL}FAIL{C.ENDC}"
-        if maximal_number_of_comparisons < result
-        else f"{label}{okcolor}{result_str}{C.ENDC}".ljust(ALIGN) + f"{C.OKGREEN}OK{C.ENDC}"
-    )
 
+def format_result(label: str, result: int | float, okcolor: str, maximal_number_of_comparisons: int):
+    result_str = format(result, ".1f" if isinstance(result, float) else "d")
+    if maximal_number_of_comparisons < result:
+        return align(f"{label}{C.FAIL}{result_str}{C.ENDC}") + f"{C.FAIL}FAIL{C.ENDC}"
+    return align(f"{label}{okcolor}{result_str}{C.ENDC}") + f"{C.OKGREEN}OK{C.ENDC}"
 
+
+@lru_cache(maxsize=None)
 def calculate_number_of_maximal_comparisons(n: int):
+    """
+    Computes F(n) = sum of ceil(log2(3k/4)) for k in [1, n].
+    The term equals j for every k with 2^(j+1) < 3k <= 2^(j+2), so the sum is taken block by block
+    in O(log n) integer steps instead of one floating point log per k.
+    """
     sum = 0
-    for k in range(1, n + 1):
-        value = (3.0 / 4.0) * k
-        sum += ceil(log2(value))
+    j = 0
+    k = 1
+    while k <= n:
+        last_k = min(n, (1 << (j + 2)) // 3)
+        sum += j * (last_k - k + 1)
+        k = last_k + 1
+        j += 1
     return sum
 
 
@@ -87,15 +107,14 @@ def valid_range(input_range: str):
 
     # (?:,\s*\d+-\d+)*$            that string can additionally have any number of comma separated
     #                              {positive number}-{positive number}
-    pattern = r"^\d+-\d+(?:,\s*\d+-\d+)*$"
-    if not re.fullmatch(pattern, input_range):
+    if not _RANGE_RE.fullmatch(input_range):
         raise argparse.ArgumentTypeError(
             f"Not a valid range: {C.WARNING}{input_range}{C.ENDC}."
             " Use positive numbers. Format: start-end[, ... start-end]",
         )
 
-    # re.split(r'\s*,\s*', input_range) splits the string by comma and any number of spaces before or after it
-    ranges = [extract_range(range_str) for range_str in re.split(r"\s*,\s*", input_range)]
+    # _SPLIT_RE splits the string by comma and any number of spaces before or after it
+    ranges = [extract_range(range_str) for range_str in _SPLIT_RE.split(input_range)]
     if not all(ranges):
         raise argparse.ArgumentTypeError(
             f"Not a valid range: {C.WARNING}{input_range}{C.ENDC}. "
@@ -123,48 +142,72 @@ def create_test_input(test_range: range) -> list[str]:
     """
     Takes a range of numbers and convert it to the shuffled list of strings.
     """
-    res = list(test_range)
-    random.shuffle(res)
-    return [str(i) for i in res]
+    return list(map(str, random.sample(test_range, len(test_range))))
+
+
+# Per-worker settings, filled in once by init_worker when the pool starts a process.
+_EXECUTABLE = ""
+_OUTPUT_CHECK = True
+
+
+def init_worker(executable: str, output_check: bool):
+    """
+    Stores the settings shared by every test in the worker process, so they are not sent with each task.
+    """
+    global _EXECUTABLE, _OUTPUT_CHECK
+    _EXECUTABLE = executable
+    _OUTPUT_CHECK = output_check
 
 
-def run_test(executable_path: pathlib.Path, test_input: list[str], output_check: bool):
+def run_test(test_range: range, maximal_number_of_comparisons: int):
+    # The input is shuffled here, in the worker, so only the range object travels through the pool.
+    test_input = create_test_input(test_range)
+    # close_fds=False lets CPython launch the child with posix_spawn and skip closing every inherited descriptor.
+    # Nothing leaks: descriptors opened by Python are non-inheritable by default (PEP 446).
     result = subprocess.run(
-        [executable_path.absolute()] + test_input,
+        [_EXECUTABLE, *test_input],
         stdout=subprocess.PIPE,
         stderr=subprocess.PIPE,
-        text=True,
+        close_fds=False,
     )
 
-    inputs = result.args[1:]
     if result.returncode != 0:
-        return ErrorCode.RETURNCODE_ERROR, inputs, result.returncode
+        return ErrorCode.RETURNCODE_ERROR, test_input, result.returncode
 
-    cleaned_ouput = re.sub(r"\x1b\[[0-9;]*m", "", result.stdout)
-    number_of_comparisons_match = re.search(r"^Number of comparisons: [0-9]+$", cleaned_ouput, re.MULTILINE)
+    cleaned_ouput = _ANSI_RE.sub(b"", result.stdout)
+    number_of_comparisons_match = _COMPARISONS_RE.search(cleaned_ouput)
     if not number_of_comparisons_match:
-        return ErrorCode.NO_NUMBER_OF_COMPARISONS_IN_OUTPUT, cleaned_ouput
+        return ErrorCode.NO_NUMBER_OF_COMPARISONS_IN_OUTPUT, cleaned_ouput.decode(errors="replace")
 
-    number_of_comparisons = int(number_of_comparisons_match.group(0).split()[3])
+    number_of_comparisons = int(number_of_comparisons_match.group(1))
     if number_of_comparisons > maximal_number_of_comparisons:
-        return ErrorCode.NUMBER_OF_COMPARISONS_EXCEEDED, inputs, number_of_comparisons
+        return ErrorCode.NUMBER_OF_COMPARISONS_EXCEEDED, test_input, number_of_comparisons
 
-    if output_check:
-        valid_output_match = re.search(r"^\s*After:\s*\[?((?:\d+\s*)+)\]?\s*$", cleaned_ouput, re.MULTILINE)
+    if _OUTPUT_CHECK:
+        valid_output_match = _AFTER_RE.search(cleaned_ouput)
         if not valid_output_match:
-            return ErrorCode.NO_AFTER_OUTPUT, cleaned_ouput
+            return ErrorCode.NO_AFTER_OUTPUT, cleaned_ouput.decode(errors="replace")
 
         split_output = valid_output_match.group(1).strip().split()
         if len(split_output) != len(test_input):
-            return ErrorCode.OUTPUT_NUMBERS_DIFFER_FROM_INPUT, " ".join(split_output), " ".join(test_input)
+            return (
+                ErrorCode.OUTPUT_NUMBERS_DIFFER_FROM_INPUT,
+                b" ".join(split_output).decode(),
+                " ".join(test_input),
+            )
 
         expected = [int(n) for n in test_input]
         expected.sort()
         split_output_int = [int(n) for n in split_output]
         if split_output_int != expected:
-            return ErrorCode.OUTPUT_NUMBERS_NOT_SORTED, " ".join(split_output), " ".join([str(n) for n in expected])
+            return (
+                ErrorCode.OUTPUT_NUMBERS_NOT_SORTED,
+                b" ".join(split_output).decode(),
+                " ".join([str(n) for n in expected]),
+            )
 
-    return number_of_comparisons, inputs
+    # The input is only needed to report failures, so it is not sent back on success.
+    return number_of_comparisons, None
 
 
 def represent_range(r: range):
@@ -231,7 +274,8 @@ if __name__ == "__main__":
     args = parser.parse_args()
     ranges_to_test = args.ranges
 
-    if args.no_colors:
+    # Colors are also dropped when the output is redirected, where the escape codes would only be noise.
+    if args.no_colors or not sys.stdout.isatty():
 
         class C:
             HEADER = ""
@@ -246,18 +290,26 @@ if __name__ == "__main__":
         f"Running the program {C.WARNING}{args.times}{C.ENDC} times for each of the ranges: "
         f"{', '.join([represent_range(r) for r in args.ranges])}\n",
     )
-    for i, test_range in enumerate(ranges_to_test):
-        print(f"Testing set of {len(test_range)} numbers:")
-        maximal_number_of_comparisons = calculate_number_of_maximal_comparisons(len(test_range))
-        test_inputs = [create_test_input(test_range) for _ in range(args.times)]
-        results = []
-        with ProcessPoolExecutor() as executor:
-            futures = [
-                executor.submit(run_test, args.executable, test_input, args.output_check) for test_input in test_inputs
-            ]
-            for future in as_completed(futures):
-                result = future.result()
-
+    # Tests are handed to the workers in chunks to cut down on the inter-process round trips.
+    chunksize = max(1, args.times // ((os.cpu_count() or 1) * 4))
+    # The path is resolved once here and handed to the workers as a plain string.
+    executable = str(args.executable.resolve())
+    # Worker processes are started once and reused for every range.
+    with ProcessPoolExecutor(initializer=init_worker, initargs=(executable, args.output_check)) as executor:
+        for i, test_range in enumerate(ranges_to_test):
+            n = len(test_range)
+            print(f"Testing set of {n} numbers:")
+            maximal_number_of_comparisons = calculate_number_of_maximal_comparisons(n)
+            # Statistics are accumulated as the results arrive instead of being collected into a list.
+            worst_result = 0
+            best_result = sys.maxsize
+            total_result = 0
+            for result in executor.map(
+                run_test,
+                repeat(test_range, args.times),
+                repeat(maximal_number_of_comparisons),
+                chunksize=chunksize,
+            ):
                 match result[0]:
                     case ErrorCode.RETURNCODE_ERROR:
                         inputs, returncode = result[1], result[2]
@@ -290,7 +342,6 @@ if __name__ == "__main__":
                             file=sys.stderr,
                         )
                         one_of_inputs_failed = True
-                        results.append(number_of_comparisons)
 
                     case ErrorCode.NO_AFTER_OUTPUT:
                         cleaned_output = result[1]
@@ -324,28 +375,36 @@ if __name__ == "__main__":
                         exit(1)
 
                     case _:
-                        results.append(result[0])
-
-        maximal_number_of_comparisons_str = (
-            f"Maximal comparisons allowed: "
-            f"F({C.WARNING}{len(test_range)}{C.ENDC}) = "
-            f"{C.WARNING}{maximal_number_of_comparisons}{C.ENDC}".ljust(ALIGN)
-        )
-        worst_result = max(results)
-        worst_result_str = format_result("Worst result:                ", worst_result, C.OKGREEN)
-
-        best_result = min(results)
-        best_result_str = format_result("Best result:                 ", best_result, C.OKBLUE)
-
-        average_result = sum(results) / len(results)
-        average_result_str = format_result("Average result:              ", average_result, C.OKCYAN)
-
-        print(f"{maximal_number_of_comparisons_str}")
-        print(f"{worst_result_str}")
-        print(f"{best_result_str}")
-        print(f"{average_result_str}")
-        if i != len(ranges_to_test) - 1:
-            print("")
+                        number_of_comparisons = result[0]
+
+                worst_result = max(worst_result, number_of_comparisons)
+                best_result = min(best_result, number_of_comparisons)
+                total_result += number_of_comparisons
+
+            maximal_number_of_comparisons_str = align(
+                f"Maximal comparisons allowed: "
+                f"F({C.WARNING}{n}{C.ENDC}) = "
+                f"{C.WARNING}{maximal_number_of_comparisons}{C.ENDC}"
+            )
+            worst_result_str = format_result(
+                "Worst result:                ", worst_result, C.OKGREEN, maximal_number_of_comparisons
+            )
+
+            best_result_str = format_result(
+                "Best result:                 ", best_result, C.OKBLUE, maximal_number_of_comparisons
+            )
+
+            average_result = total_result / args.times
+            average_result_str = format_result(
+                "Average result:              ", average_result, C.OKCYAN, maximal_number_of_comparisons
+            )
+
+            print(f"{maximal_number_of_comparisons_str}")
+            print(f"{worst_result_str}")
+            print(f"{best_result_str}")
+            print(f"{average_result_str}")
+            if i != len(ranges_to_test) - 1:
+                print("")
 
     if one_of_inputs_failed:
         print(f"\n{C.FAIL}SOME OF THE TESTS FAILED{C.ENDC}")